@@ -1,56 +1,180 @@
+import functools
 import json
-import itertools
+import queue
+import threading
 
-def generate_combinations(sections):
-    combinations_list = []
+try:
+    import orjson
 
-    for input_section in itertools.combinations(sections, 1):
-        input_sections = list(input_section)
-        output_sections = [s for s in sections if s not in input_sections]
-        combinations_list.append((input_sections, output_sections))
-    
-    return combinations_list
+    def dumps(obj):
+        return orjson.dumps(obj)
+except ImportError:
+    def dumps(obj):
+        return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode('utf-8')
 
-def generate_fine_tuning_samples(data_file, output_file):
-    with open(data_file, 'r', encoding='utf-8') as f:
-        dataset = json.load(f)
-    
-    total_entries = len(dataset)
-    with open(output_file, 'w', encoding='utf-8') as f_out:
-        for idx, entry in enumerate(dataset):
-            sections = entry['sections']
-            section_titles = list(sections.keys())
-    
-            if len(section_titles) < 2: 
-                print(f"Skipping {entry.get('name', 'Unknown Filename')} - Not enough sections. {len(section_titles)}")
+try:
+    import ijson
+except ImportError:
+    ijson = None
+
+WRITE_BUFFER_SIZE = 1 << 18  # hand accumulated samples to the writer once this many bytes are pending
+WRITE_QUEUE_SIZE = 16  # chunks allowed to wait on the writer thread
+
+# Write each page's sections once plus index-only samples instead of full
+# input/output text; expand_compact_samples() turns it back into samples
+COMPACT_OUTPUT = False
+
+def generate_combinations(n):
+    # Walk bitmasks instead of itertools.combinations: bit i set means
+    # section i is an input, everything else is output. Only single-bit
+    # masks are used, i.e. one input section predicting the rest.
+    # Yields (input, output) lists of section indices.
+    if n < 2:
+        # a lone section has nothing left to predict
+        return
+
+    for i in range(n):
+        m = 1 << i
+        input_idx = [j for j in range(n) if (m >> j) & 1]
+        output_idx = [j for j in range(n) if not (m >> j) & 1]
+        yield input_idx, output_idx
+
+@functools.lru_cache(maxsize=None)
+def split_table(n):
+    # The splits only depend on the section count, so enumerate them once per
+    # distinct n and reuse the index table for every page of that size.
+    return tuple(
+        (tuple(input_idx), tuple(output_idx))
+        for input_idx, output_idx in generate_combinations(n)
+    )
+
+def iter_entries(data_file):
+    # Stream entries out of the top-level array so the whole dataset is never
+    # held in memory; ijson picks its C backend when one is available.
+    if ijson is None:
+        with open(data_file, 'r', encoding='utf-8') as f:
+            yield from json.load(f)
+        return
+
+    with open(data_file, 'rb') as f:
+        yield from ijson.items(f, 'item', use_float=True)
+
+def encode_compact_page(idx, entry, splits):
+    # One header line carries the section bodies, each sample line only
+    # references them by position: {"p": page, "i": inputs, "o": outputs}
+    table = [{"title": title, "body": body.strip()} for title, body in entry['sections'].items()]
+    lines = [dumps({"p": idx, "page": entry.get('name'), "sections": table}) + b'\n']
+    lines.extend(
+        dumps({"p": idx, "i": input_idx, "o": output_idx}) + b'\n'
+        for input_idx, output_idx in splits
+    )
+    return lines
+
+def expand_compact_samples(compact_file):
+    # Rebuilds {"input", "output"} samples from a COMPACT_OUTPUT file
+    pieces = []
+    with open(compact_file, 'r', encoding='utf-8') as f:
+        for line in f:
+            record = json.loads(line)
+
+            if "sections" in record:
+                pieces = [
+                    f"<SECTION>{section['title'].upper()}</SECTION>\n{section['body']}"
+                    for section in record["sections"]
+                ]
                 continue
 
-            #if len(section_titles) > 10:
-            #    print(f"Skipping {entry.get('name', 'Unknown Filename')} - Too many sections. {len(section_titles)}")
-            #    continue
-    
-            combinations = generate_combinations(section_titles)
+            yield {
+                "input": "\n".join(pieces[i] for i in record["i"]),
+                "output": "\n".join(pieces[i] for i in record["o"]),
+            }
+
+def generate_fine_tuning_samples(data_file, output_file):
+    with open(output_file, 'wb', buffering=1 << 20) as f_out:
+        # a single writer thread does the file I/O so encoding never waits on it
+        chunks = queue.Queue(maxsize=WRITE_QUEUE_SIZE)
+        errors = []
+
+        def writer():
+            while (chunk := chunks.get()) is not None:
+                if errors:
+                    continue
+                try:
+                    f_out.write(chunk)
+                except Exception as e:
+                    errors.append(e)
+
+        thread = threading.Thread(target=writer, daemon=True)
+        thread.start()
+
+        buf = []
+        buf_len = 0
+
+        try:
+            for idx, entry in enumerate(iter_entries(data_file)):
+                sections = entry['sections']
+                n = len(sections)
     
-            # print(len(combinations), section_titles)
+                if n < 2: 
+                    print(f"Skipping {entry.get('name', 'Unknown Filename')} - Not enough sections. {n}")
+                    continue
+
+                #if n > 10:
+                #    print(f"Skipping {entry.get('name', 'Unknown Filename')} - Too many sections. {n}")
+                #    continue
+
+                combinations = split_table(n)
 
-            for input_sections, output_sections in combinations:
+                if COMPACT_OUTPUT:
+                    lines = encode_compact_page(idx, entry, combinations)
+                else:
+                    # format each section once rather than once per combination
+                    pieces = [
+                        f"<SECTION>{title.upper()}</SECTION>\n{body.strip()}"
+                        for title, body in sections.items()
+                    ]
 
-                input_content = "\n".join(
-                    f"<SECTION>{title.upper()}</SECTION>\n{sections[title].strip()}"
-                    for title in input_sections
-                )
+                    # JSON string escaping works character by character, so each
+                    # section is escaped once and samples are spliced together from
+                    # the escaped bytes, joined by an escaped newline
+                    encoded = [dumps(piece)[1:-1] for piece in pieces]
 
-                output_content = "\n".join(
-                    f"<SECTION>{title.upper()}</SECTION>\n{sections[title].strip()}"
-                    for title in output_sections
-                )
-                io_pair = {"input": input_content, "output": output_content}
+                    # str.join on a list skips the generator materialization step
+                    lines = [
+                        b"".join((
+                            b'{"input":"',
+                            b"\\n".join([encoded[i] for i in input_idx]),
+                            b'","output":"',
+                            b"\\n".join([encoded[i] for i in output_idx]),
+                            b'"}\n',
+                        ))
+                        for input_idx, output_idx in combinations
+                    ]
 
-                f_out.write(json.dumps(io_pair) + '\n')
+                buf.extend(lines)
+                buf_len += sum(map(len, lines))
+
+                if buf_len > WRITE_BUFFER_SIZE:
+                    # stop generating as soon as the writer has failed
+                    if errors:
+                        break
+                    chunks.put(b"".join(buf))
+                    buf.clear()
+                    buf_len = 0
     
-            print(f"{idx + 1}/{total_entries}: {entry.get('name', 'Unknown Filename')}")
+                print(f"{idx + 1}: {entry.get('name', 'Unknown Filename')}")
+
+            if buf and not errors:
+                chunks.put(b"".join(buf))
+        finally:
+            chunks.put(None)
+            thread.join()
+
+        if errors:
+            raise errors[0]
     
     print(f"Fine-tuning samples have been saved to {output_file}")
 
-generate_fine_tuning_samples('man_pages.json', 'masked_man_pages.json')
+if __name__ == "__main__":
+    generate_fine_tuning_samples('man_pages.json', 'masked_man_pages.json')
 
@@ -3,6 +3,8 @@ import os
 import json
 import subprocess
 import re
+import bisect
+from concurrent.futures import ProcessPoolExecutor
 
 PATH = "/usr/share/man/" 
 SECTIONS = ["man1"]# ,"man2","man3","man4","man5","man6","man7", "man8"]
@@ -18,14 +20,39 @@ CREATE_GROFF = False
 REMOVE_ANSI_FORMAT = True 
 REMOVE_GROFF_FORMAT = True 
 
+REQUIRED_SECTIONS = ["NAME"]
+GROFF_MACROS = [b".SH", b".TH", b".PP", b".br"]
+
+# Regular expression to match ANSI escape sequences
+_ANSI_RE = re.compile(r'\x1B(?:[@-Z\\-_]|\[[0-?]*[ -/]*[@-~])')
+# .SH section headers in raw groff source
+_SECTION_RE = re.compile(r'^\s*\.SH\s+"?(.*?)"?\s*$', re.MULTILINE)
+# .SH headers for each required section, matched against raw page bytes
+_REQUIRED_SECTION_RES = [
+    re.compile(rb'(?im)^\.SH\s+"?' + re.escape(section.encode()) + rb'\b')
+    for section in REQUIRED_SECTIONS
+]
+# groff escapes that can appear in .SH titles, and what -Tutf8 prints for them
+_GROFF_ESCAPE_RE = re.compile(r'\\(?:f(?:\[[^\]]*\]|\(..|.)|\(..|\[[^\]]*\]|.)')
+_GROFF_NAMED_CHARS = {
+    "\\-": "-", "\\e": "\\", "\\ ": " ", "\\~": " ",
+    "\\(lq": '"', "\\(rq": '"', "\\(aq": "'", "\\(oq": "'", "\\(cq": "'",
+    "\\(em": "-", "\\(en": "-", "\\(hy": "-",
+}
+# characters grotty may swap for typographic variants
+_RENDERED_CHAR_CLASSES = {
+    "-": "[-\u2010\u2013\u2014\u2212]",
+    "'": "['\u2018\u2019]",
+    "`": "[`\u2018]",
+    '"': '["\u201c\u201d]',
+}
+
 history = { "totalValid" : 0,
            "totalNonvalid"  : 0,
         }
 
 def clear_terminal_formatting(text):
-    # Regular expression to match ANSI escape sequences
-    ansi_escape = re.compile(r'\x1B(?:[@-Z\\-_]|\[[0-?]*[ -/]*[@-~])')
-    return ansi_escape.sub('', text)
+    return _ANSI_RE.sub('', text)
 
 def groff_to_html(groff_content):
     html = subprocess.run(
@@ -38,10 +65,9 @@ def groff_to_html(groff_content):
     return html.stdout
 
 def is_standard_groff(content):
-    required_sections = ["NAME"]
-    groff_macros = [".SH", ".TH", ".PP", ".br"]
-    has_sections = all(section in content.upper() for section in required_sections)
-    has_groff_formatting = any(macro in content for macro in groff_macros)
+    # content is the raw page bytes; every required section must be a header
+    has_sections = all(regex.search(content) for regex in _REQUIRED_SECTION_RES)
+    has_groff_formatting = any(macro in content for macro in GROFF_MACROS)
 
     return has_sections and has_groff_formatting
 
@@ -49,24 +75,25 @@ def is_standard_groff(content):
 def handle_groff(content):
     def remove_groff_format(content):
         status = False
+        # groff reads the raw page bytes; only its output gets decoded
         content = subprocess.run(
             ["groff", "-Tutf8","-man"],  
             input=content,
-            text=True,             
             stdout=subprocess.PIPE,
             stderr=subprocess.PIPE 
         )
         if content.returncode == 0:
+            stdout = content.stdout.decode('utf-8', errors='ignore')
         
             if REMOVE_ANSI_FORMAT:
-                content = clear_terminal_formatting(content.stdout)
+                content = clear_terminal_formatting(stdout)
             else:
-                content = content.stdout
+                content = stdout
             
             status = True 
         else:
             print("Error:")
-            print(content.stderr)
+            print(content.stderr.decode('utf-8', errors='ignore'))
             status = False
     
         return status, content
@@ -93,39 +120,45 @@ def parse_groff_subsections(groff_content):
 
     return sections
 
-def extract_and_map_sections(groff_content, cleaned_content):
+def rendered_heading_re(title):
+    # Matches the line groff -Tutf8 prints for a .SH title: the title with
+    # escapes resolved, unindented, alone on its line
+    rendered = _GROFF_ESCAPE_RE.sub(lambda m: _GROFF_NAMED_CHARS.get(m.group(0), ""), title).strip()
+    if not rendered:
+        return None
 
-    section_regex = re.compile(r'^\s*\.SH\s+"?(.*?)"?\s*$', re.MULTILINE)
-    
-    # extract section headers and positions from the original Groff content
-    matches = list(section_regex.finditer(groff_content))
-    
-    if not matches:
-        print("No sections found in Groff content.")
+    pattern = "".join(
+        r"[ \t]+" if char.isspace() else _RENDERED_CHAR_CLASSES.get(char, re.escape(char))
+        for char in rendered
+    )
+    return re.compile(rf"^{pattern}[ \t]*$", re.MULTILINE)
+
+def map_sections_by_title(titles, cleaned_content):
+    # Fallback for pages whose headings cannot be anchored: search the raw
+    # titles in the cleaned text
+    titles = list(dict.fromkeys(title for title in titles if title))
+    if not titles:
         return {}
 
-    # extract subsections and their content from the Groff content
-    subsections = {}
-    for i, match in enumerate(matches):
-        title = match.group(1).strip()
-        start = match.end()
-        end = matches[i + 1].start() if i + 1 < len(matches) else len(groff_content)
-        groff_section_content = groff_content[start:end].strip()
-        subsections[title] = groff_section_content
+    # locate every title in one pass over the cleaned text, longest first so
+    # e.g. "SEE ALSO" wins over a shorter title starting at the same spot
+    title_re = re.compile('|'.join(re.escape(t) for t in sorted(titles, key=len, reverse=True)))
+    positions = {}
+    for match in title_re.finditer(cleaned_content):
+        positions.setdefault(match.group(0), []).append(match.start())
 
     mapped_sections = {}
-    for i, title in enumerate(subsections):
-        if title in cleaned_content:
-            # print("TITLE:", title)
-            start = cleaned_content.index(title) + len(title)  # skip the title text itself
-            
-            if i + 1 < len(subsections):
-                # find the next title to determine the end position
-                next_title = list(subsections.keys())[i + 1]
-                end = cleaned_content.find(next_title, start)
-            else:
-                # for the last section, take everything until the end
-                end = len(cleaned_content)
+    for i, title in enumerate(titles):
+        if title in positions:
+            start = positions[title][0] + len(title)  # skip the title text itself
+            end = len(cleaned_content)
+
+            if i + 1 < len(titles):
+                # the next title's first occurrence after this one ends the section
+                next_positions = positions.get(titles[i + 1], [])
+                j = bisect.bisect_left(next_positions, start)
+                if j < len(next_positions):
+                    end = next_positions[j]
             
             # extract the section content, skip title
             section_content = cleaned_content[start:end].strip()
@@ -135,61 +168,120 @@ def extract_and_map_sections(groff_content, cleaned_content):
 
     return mapped_sections
 
+def extract_and_map_sections(groff_content, cleaned_content):
+
+    # extract section headers and positions from the original Groff content
+    matches = list(_SECTION_RE.finditer(groff_content))
+    
+    if not matches:
+        print("No sections found in Groff content.")
+        return {}
+
+    titles = [match.group(1).strip() for match in matches]
+
+    # without groff rendering the .SH matches are the headings themselves;
+    # otherwise find each title's own rendered heading, scanning forward
+    if cleaned_content == groff_content:
+        headings = matches
+    else:
+        headings = []
+        pos = 0
+        for title in titles:
+            heading_re = rendered_heading_re(title)
+            heading = heading_re.search(cleaned_content, pos) if heading_re else None
+            if heading is None:
+                print(f"Warning: heading '{title}' not found in cleaned content, searching titles instead.")
+                return map_sections_by_title(titles, cleaned_content)
+            headings.append(heading)
+            pos = heading.end()
+
+    content_end = len(cleaned_content)
+    if headings is not matches:
+        # groff closes the page with a footer line ending in the same
+        # "NAME(SECTION)" as the header; keep it out of the last section
+        lines = cleaned_content.strip().split("\n")
+        header, footer = lines[0].split(), lines[-1].split()
+        if len(lines) > 1 and header and footer and header[-1] == footer[-1]:
+            content_end = cleaned_content.rindex(lines[-1])
+
+    mapped_sections = {}
+    for title, heading, next_heading in zip(titles, headings, headings[1:] + [None]):
+        start = heading.end()  # skip the title text itself
+        end = next_heading.start() if next_heading else max(content_end, start)
+
+        # extract the section content, skip title
+        mapped_sections[title] = cleaned_content[start:end].strip()
+
+    return mapped_sections
+
+
+def _process_one_file(idx, file_path):
+    # Runs in a worker process; returns the page entry or None if skipped
+    file = os.path.basename(file_path)
+
+    if not file.endswith(".gz"):
+        return None
 
-def extract_man_pages(path, sections):
-    data = []
     try:
-        os.mkdir(HTML_OUT_DIR)
-    except FileExistsError:
-        print(f"{HTML_OUT_DIR} EXISTS")
+        with gzip.open(file_path, 'rb') as f:
+            raw_content = f.read()
+            groff_content = raw_content.decode('utf-8', errors='ignore')
+            name_split = file.split('.')[0]
 
-    print(f"TOTAL MAN ENTRIES: {len(os.listdir(path))}")
+            if is_standard_groff(raw_content):
+                cleaned_content = groff_content
 
-    for section in sections:
-        abs_path = os.path.join(path, section)
+                if REMOVE_GROFF_FORMAT:
+                    status, cleaned_content = handle_groff(raw_content)
+                    if not status:
+                        return None
+
+                subsections = extract_and_map_sections(groff_content, cleaned_content)
 
-        for idx, file in enumerate(os.listdir(abs_path)):
-            file_path = os.path.join(abs_path, file)
+                print(f"SUCCESS {idx} {file}")
 
-            if file.endswith(".gz"):
-                try:
-                    with gzip.open(file_path, 'rt', encoding='utf-8', errors='ignore') as f:
-                        groff_content = f.read()
-                        name_split = file.split('.')[0]
+                if CREATE_GROFF:
+                    groff_filename = f"{file.split('.')[0]}.groff"
+                    groff_path = os.path.join(HTML_OUT_DIR, groff_filename)
+                    with open(groff_path, 'w', encoding='utf-8') as test:
+                        test.write(groff_content)
 
-                        if is_standard_groff(groff_content):
-                            cleaned_content = groff_content
+                if CREATE_HTML:
+                    html_content = groff_to_html(cleaned_content)
+                    html_filename = f"{file.split('.')[0]}.html"
+                    html_path = os.path.join(HTML_OUT_DIR, html_filename)
+                    with open(html_path, 'w', encoding='utf-8') as htmlfile:
+                        htmlfile.write(html_content)
 
-                            if REMOVE_GROFF_FORMAT:
-                                status, cleaned_content = handle_groff(groff_content)
-                                if not status:
-                                    continue
+                return {"name": name_split, "sections": subsections}
 
-                            subsections = extract_and_map_sections(groff_content, cleaned_content)
+            else:
+                print(f'NON STANDARD FORMATTING {idx} {file}')
+                return None
 
-                            data.append({"name": name_split, "sections": subsections})
+    except Exception as e:
+        print(f"Error processing {file}: {e}")
+        return None
 
-                            print(f"SUCCESS {idx} {file}")
 
-                            if CREATE_GROFF:
-                                groff_filename = f"{file.split('.')[0]}.groff"
-                                groff_path = os.path.join(HTML_OUT_DIR, groff_filename)
-                                with open(groff_path, 'w', encoding='utf-8') as test:
-                                    test.write(groff_content)
+def extract_man_pages(path, sections):
+    try:
+        os.mkdir(HTML_OUT_DIR)
+    except FileExistsError:
+        print(f"{HTML_OUT_DIR} EXISTS")
 
-                            if CREATE_HTML:
-                                html_content = groff_to_html(cleaned_content)
-                                html_filename = f"{file.split('.')[0]}.html"
-                                html_path = os.path.join(HTML_OUT_DIR, html_filename)
-                                with open(html_path, 'w', encoding='utf-8') as htmlfile:
-                                    htmlfile.write(html_content)
+    print(f"TOTAL MAN ENTRIES: {len(os.listdir(path))}")
 
-                        else:
-                            print(f'NON STANDARD FORMATTING {idx} {file}')
-                            continue
+    file_paths = []
+    for section in sections:
+        abs_path = os.path.join(path, section)
+        file_paths.extend(os.path.join(abs_path, file) for file in os.listdir(abs_path))
 
-                except Exception as e:
-                    print(f"Error processing {file}: {e}")
+    # pages are independent, so one pool covers every section; the groff/html
+    # side files are written by the workers to avoid shipping them back
+    with ProcessPoolExecutor() as executor:
+        results = executor.map(_process_one_file, range(len(file_paths)), file_paths, chunksize=32)
+        data = [entry for entry in results if entry]
 
     return data
 
@@ -3,8 +3,12 @@ import os
 import json
 import subprocess
 import re
+import asyncio
 import requests
+import aiohttp
 from bs4 import BeautifulSoup
+import lxml.html
+from lxml import etree
 import time
 
 # Constants and Configuration
@@ -12,12 +16,16 @@ LOCAL_MAN_PATH = "/usr/share/man/man1"  # Path to local man pages
 OUTPUT_JSON = "man_pages.json"          # Output JSON file
 TEST_FILE = "out.groff"                 # Temporary Groff file
 HTML_OUT_DIR = "pages/"                 # Directory to save HTML pages
+CACHE_DIR = "cache/"                    # Directory for gzipped die.net HTML
 
 DIE_NET_BASE_URL = "https://linux.die.net/man/"  # Base URL for die.net man pages
 SCRAPE_DELAY = 1  # Delay in seconds between HTTP requests to be respectful
+MAX_CONCURRENT_REQUESTS = 8  # Pages fetched/processed at once in extract_man_pages
+REQUESTS_PER_SECOND = 4  # Pace of new die.net requests across all fetches
 HEADERS = {
     "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64)",
     "Accept": "text/html,application/xhtml+xml",
+    "Accept-Encoding": "gzip",
     # Add other headers if necessary
 }
 
@@ -28,16 +36,19 @@ SCRAPE_ONLY = True   # Set to True to only scrape die.net for man pages
 REQUIRED_SECTIONS = ["NAME", "DESCRIPTION", "USAGE", "OPTIONS"]  # Required sections
 GROFF_MACROS = [".SH", ".TH", ".PP", ".br"]  # Minimal Groff macros
 
+_XML_DECLARATION_RE = re.compile(r'^\s*<\?xml[^>]*\?>')  # leading <?xml ...?> of XHTML pages
+_ANSI_RE = re.compile(r'\x1B(?:[@-Z\\-_]|\[[0-?]*[ -/]*[@-~])')  # ANSI escape sequences
+
 
 # Ensure output directories exist
 os.makedirs(HTML_OUT_DIR, exist_ok=True)
+os.makedirs(CACHE_DIR, exist_ok=True)
 
 def clear_terminal_formatting(text):
     """
     Removes ANSI escape sequences from the text.
     """
-    ansi_escape = re.compile(r'\x1B(?:[@-Z\\-_]|\[[0-?]*[ -/]*[@-~])')
-    return ansi_escape.sub('', text)
+    return _ANSI_RE.sub('', text)
 
 def groff_to_html(groff_content):
     """
@@ -55,36 +66,61 @@ def groff_to_html(groff_content):
         return None
     return result.stdout
 
+def element_text(element, strip=False):
+    """
+    Returns the text of an lxml element and its descendants, like BeautifulSoup's get_text().
+    """
+    if strip:
+        return "".join(text.strip() for text in element.itertext())
+    return "".join(element.itertext())
+
 def html_to_groff(html_content):
     """
     Converts HTML content to Groff format by mapping HTML tags to Groff macros.
     """
-    soup = BeautifulSoup(html_content, "html.parser")
+    # lxml rejects str input carrying an XML encoding declaration (XHTML), and
+    # raises on documents with no content; those convert to nothing
+    html_content = _XML_DECLARATION_RE.sub('', html_content, count=1)
+    try:
+        tree = lxml.html.fromstring(html_content)
+    except (ValueError, etree.ParserError) as e:
+        print(f"Error parsing HTML: {e}")
+        return ""
     groff_output = []
 
-    for element in soup.recursiveChildGenerator():
-        if element.name:
-            if element.name == "h1":
-                groff_output.append(f".SH {element.get_text(strip=True)}\n")
-            elif element.name == "h2":
-                groff_output.append(f".SS {element.get_text(strip=True)}\n")
-            elif element.name == "p":
+    # visits tags and text in document order, as BeautifulSoup's
+    # recursiveChildGenerator did; comments only contribute their tail text
+    def visit(element):
+        if isinstance(element.tag, str):
+            if element.tag == "h1":
+                groff_output.append(f".SH {element_text(element, strip=True)}\n")
+            elif element.tag == "h2":
+                groff_output.append(f".SS {element_text(element, strip=True)}\n")
+            elif element.tag == "p":
                 groff_output.append(".PP\n")
-                groff_output.append(f"{element.get_text(strip=True)}\n")
-            elif element.name == "pre":
+                groff_output.append(f"{element_text(element, strip=True)}\n")
+            elif element.tag == "pre":
                 groff_output.append(".nf\n")
-                groff_output.append(f"{element.get_text()}\n")
+                groff_output.append(f"{element_text(element)}\n")
                 groff_output.append(".fi\n")
-            elif element.name == "li":
-                groff_output.append(f".IP \\(bu\n{element.get_text(strip=True)}\n")
-            elif element.name == "b":
-                groff_output.append(f"\\fB{element.get_text(strip=True)}\\fP")
-            elif element.name == "i":
-                groff_output.append(f"\\fI{element.get_text(strip=True)}\\fP")
+            elif element.tag == "li":
+                groff_output.append(f".IP \\(bu\n{element_text(element, strip=True)}\n")
+            elif element.tag == "b":
+                groff_output.append(f"\\fB{element_text(element, strip=True)}\\fP")
+            elif element.tag == "i":
+                groff_output.append(f"\\fI{element_text(element, strip=True)}\\fP")
             # Add more tag mappings as needed
-        elif isinstance(element, str):
-            groff_output.append(element)
 
+            if element.text:
+                groff_output.append(element.text)
+
+        for child in element:
+            visit(child)
+
+        if element.tail:
+            groff_output.append(element.tail)
+
+    visit(tree)
     return "".join(groff_output)
 
 def is_standard_groff(content):
@@ -101,6 +137,33 @@ def is_standard_groff(content):
     has_groff_formatting = any(macro in content for macro in GROFF_MACROS)
     return has_sections and has_groff_formatting
 
+def cache_path(command, section):
+    """
+    Returns the on-disk cache location for a scraped man page.
+    """
+    safe_command = command.replace(os.sep, "_")
+    return os.path.join(CACHE_DIR, f"{section}_{safe_command}.html.gz")
+
+def read_cached_page(command, section):
+    """
+    Returns cached HTML for a command/section pair, or None on a cache miss.
+    """
+    try:
+        with gzip.open(cache_path(command, section), 'rt', encoding='utf-8') as f:
+            return f.read()
+    except (OSError, EOFError):
+        return None
+
+def write_cached_page(command, section, html_content):
+    """
+    Stores scraped HTML so later runs can skip the HTTP request.
+    """
+    path = cache_path(command, section)
+    tmp_path = f"{path}.tmp"
+    with gzip.open(tmp_path, 'wt', encoding='utf-8') as f:
+        f.write(html_content)
+    os.replace(tmp_path, path)
+
 def scrape_die_net(command, section=1):
     """
     Scrapes the man page for a given command from linux.die.net.
@@ -110,12 +173,17 @@ def scrape_die_net(command, section=1):
     Returns:
         str or None: HTML content of the man page or None if not found.
     """
+    cached = read_cached_page(command, section)
+    if cached is not None:
+        return cached
+
     url = f"{DIE_NET_BASE_URL}{section}/{command}"
 
     try:
         response = requests.get(url, headers=HEADERS)
         if response.status_code == 200:
             print(f"Scraped man page from die.net: {command}")
+            write_cached_page(command, section, response.text)
             return response.text
         else:
             print(f"Man page not found on die.net: {command} (Status Code: {response.status_code})")
@@ -124,6 +192,135 @@ def scrape_die_net(command, section=1):
         print(f"Error scraping {command} from die.net: {e}")
         return None
 
+class RateLimiter:
+    """
+    Token bucket that lets at most `rate` requests start per second.
+    """
+    def __init__(self, rate):
+        self.rate = rate
+        self.tokens = rate
+        self.updated = None
+        self.lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self.lock:
+            loop = asyncio.get_running_loop()
+            while True:
+                now = loop.time()
+                if self.updated is not None:
+                    self.tokens = min(self.rate, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+async def fetch_die_net(session, limiter, command, section=1):
+    """
+    Asynchronously fetches the man page for a given command from linux.die.net.
+    Args:
+        session (aiohttp.ClientSession): Shared session holding the connection pool.
+        limiter (RateLimiter): Paces request starts against die.net.
+        command (str): The command to scrape.
+        section (int): The man page section.
+    Returns:
+        str or None: HTML content of the man page or None if not found.
+    """
+    cached = read_cached_page(command, section)
+    if cached is not None:
+        return cached
+
+    url = f"{DIE_NET_BASE_URL}{section}/{command}"
+
+    await limiter.acquire()
+    try:
+        async with session.get(url) as response:
+            if response.status == 200:
+                print(f"Scraped man page from die.net: {command}")
+                html_content = await response.text()
+                write_cached_page(command, section, html_content)
+                return html_content
+            else:
+                print(f"Man page not found on die.net: {command} (Status Code: {response.status})")
+                return None
+    except Exception as e:
+        print(f"Error scraping {command} from die.net: {e}")
+        return None
+
+async def scrape_all_die_net(commands):
+    """
+    Fetches and processes man pages for all (command, section) pairs.
+    A fixed number of workers each fetch a page and convert it before taking
+    the next one, so only MAX_CONCURRENT_REQUESTS pages are held at a time.
+    Args:
+        commands (list): List of (command, section) tuples.
+    Returns:
+        list: List of man pages that passed processing.
+    """
+    limiter = RateLimiter(REQUESTS_PER_SECOND)
+    connector = aiohttp.TCPConnector(limit_per_host=MAX_CONCURRENT_REQUESTS)
+    pending = iter(enumerate(commands))
+    total_commands = len(commands)
+    scraped_data = []
+
+    async def worker(session):
+        for idx, (command, section) in pending:
+            html_content = await fetch_die_net(session, limiter, command, section)
+            print(f"Processing {command} from section {section} ({idx+1}/{total_commands})")
+            # conversion shells out to groff, keep it off the event loop
+            page = await asyncio.to_thread(process_die_net_page, command, section, html_content)
+            if page:
+                scraped_data.append(page)
+
+    async with aiohttp.ClientSession(headers=HEADERS, connector=connector) as session:
+        await asyncio.gather(*[worker(session) for _ in range(MAX_CONCURRENT_REQUESTS)])
+
+    return scraped_data
+
+def process_die_net_page(command, section, html_content):
+    """
+    Converts a scraped die.net page to Groff and saves the Groff and HTML files.
+    Args:
+        command (str): The command the page documents.
+        section (int): The man page section.
+        html_content (str or None): The scraped HTML.
+    Returns:
+        dict or None: The man page entry, or None if it was skipped.
+    """
+    if not html_content:
+        print(f"Skipping {command} due to scraping failure.")
+        return None
+
+    # Convert HTML to Groff
+    groff_content = html_to_groff(html_content)
+    if not groff_content:
+        print(f"Failed to convert HTML to Groff for {command}")
+        return None
+
+    # Verify standard formatting
+    if not is_standard_groff(groff_content):
+        print(f"Non-standard Groff formatting for {command}")
+        return None
+
+    print(f"Valid Groff formatting for {command}")
+
+    # Save Groff file
+    groff_file_path = os.path.join(HTML_OUT_DIR, f"{command}.{section}.groff")
+    with open(groff_file_path, 'w') as groff_file:
+        groff_file.write(groff_content)
+
+    # Convert Groff back to HTML
+    converted_html = groff_to_html(groff_content)
+    if converted_html:
+        # Save converted HTML
+        html_file_path = os.path.join(HTML_OUT_DIR, f"{command}.{section}.html")
+        with open(html_file_path, 'w') as htmlfile:
+            htmlfile.write(converted_html)
+    else:
+        print(f"Failed to convert Groff to HTML for {command}")
+
+    return {"filename": f"{command}.{section}.groff", "content": groff_content}
+
 def process_scraped_man_pages(commands, section=1):
     """
     Processes man pages scraped from die.net.
@@ -185,7 +382,7 @@ def get_commands_from_die_net(section=1):
     try:
         response = requests.get(url, headers=HEADERS)
         if response.status_code == 200:
-            soup = BeautifulSoup(response.text, "html.parser")
+            soup = BeautifulSoup(response.text, "lxml")
             # Find all links to man pages in the section
             links = soup.find_all('a', href=True)
             print(links)
@@ -223,46 +420,8 @@ def extract_man_pages():
     commands = list(set(commands))
     print(f"Total unique commands to process: {len(commands)}")
 
-    # Process scraped man pages
-    scraped_data = []
-    total_commands = len(commands)
-    for idx, (command, section) in enumerate(commands):
-        print(f"Processing {command} from section {section} ({idx+1}/{total_commands})")
-        html_content = scrape_die_net(command, section)
-        if html_content:
-            # Convert HTML to Groff
-            groff_content = html_to_groff(html_content)
-            if groff_content:
-                # Verify standard formatting
-                if is_standard_groff(groff_content):
-                    print(f"Valid Groff formatting for {command}")
-                    scraped_data.append({"filename": f"{command}.{section}.groff", "content": groff_content})
-
-                    # Save Groff file
-                    groff_file_path = os.path.join(HTML_OUT_DIR, f"{command}.{section}.groff")
-                    with open(groff_file_path, 'w') as groff_file:
-                        groff_file.write(groff_content)
-
-                    # Convert Groff back to HTML
-                    converted_html = groff_to_html(groff_content)
-                    if converted_html:
-                        # Save converted HTML
-                        html_file_path = os.path.join(HTML_OUT_DIR, f"{command}.{section}.html")
-                        with open(html_file_path, 'w') as htmlfile:
-                            htmlfile.write(converted_html)
-                    else:
-                        print(f"Failed to convert Groff to HTML for {command}")
-                else:
-                    print(f"Non-standard Groff formatting for {command}")
-            else:
-                print(f"Failed to convert HTML to Groff for {command}")
-        else:
-            print(f"Skipping {command} due to scraping failure.")
-
-        # Respectful scraping: avoid overwhelming the server
-        time.sleep(SCRAPE_DELAY)
-
-    return scraped_data
+    # Fetch and process pages concurrently
+    return asyncio.run(scrape_all_die_net(commands))
 
 def main():
     """